@@ -1,2 +1,2 @@
-"""Allow users to access the function directly."""
-from hkdfs.hkdfs import hkdfs
+"""Allow users to access the functions and classes directly."""
+from hkdfs.hkdfs import hkdfs, hkdfs_into, Deriver
@@ -6,16 +6,109 @@ from __future__ import annotations
 from typing import Union, Optional
 from collections.abc import Callable
 import doctest
+import functools
 import hashlib
 import hmac
 
+try: # pragma: no cover
+    from cryptography.hazmat.primitives import hashes as _hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF as _HKDF
+    from cryptography.hazmat.primitives.kdf.hkdf import (
+        HKDFExpand as _HKDFExpand
+    )
+    _ACCELERATED_HASHES = {
+        hashlib.sha1: _hashes.SHA1,
+        hashlib.sha256: _hashes.SHA256,
+        hashlib.sha384: _hashes.SHA384,
+        hashlib.sha512: _hashes.SHA512
+    }
+except ImportError: # pragma: no cover
+    _HKDF = None
+    _HKDFExpand = None
+    _ACCELERATED_HASHES = {}
+
+_IPAD_TRANSLATION = bytes(byte ^ 0x36 for byte in range(256))
+_OPAD_TRANSLATION = bytes(byte ^ 0x5C for byte in range(256))
+_COUNTER_BYTES = tuple(bytes((byte,)) for byte in range(256))
+_BYTES_LIKE = (bytes, bytearray)
+
+@functools.lru_cache(maxsize=None)
+def _hash_meta(
+        hash: Callable[ # pylint: disable=redefined-builtin
+            [Union[bytes, bytearray]],
+            hashlib._hashlib.HASH
+        ]
+    ) -> tuple[int, int, Optional[str]]:
+    """
+    Return the digest size, block size, and registered name (or ``None``
+    if there is no name) of the supplied hash function, instantiating it
+    at most once per distinct function.
+    """
+    instance = hash()
+    return (
+        instance.digest_size,
+        instance.block_size,
+        getattr(instance, 'name', None)
+    )
+
+@functools.lru_cache(maxsize=None)
+def _zero_salt(digest_size: int) -> bytes:
+    """
+    Return (and cache) an all-zero salt of the supplied size for use when
+    no salt is provided during extraction.
+    """
+    return bytes(digest_size)
+
+def _hmac_contexts(
+        key: Union[bytes, bytearray],
+        hash: Callable[ # pylint: disable=redefined-builtin
+            [Union[bytes, bytearray]],
+            hashlib._hashlib.HASH
+        ] = hashlib.sha256
+    ) -> tuple[hashlib._hashlib.HASH, hashlib._hashlib.HASH]:
+    """
+    Build the inner and outer hash contexts of an HMAC instance keyed with
+    the supplied key. Copies of these contexts can be used to compute many
+    HMAC digests under the same key without repeating the key setup and
+    without the per-call overhead of the :obj:`hmac` module's wrapper
+    methods.
+
+    :param key: Key with which to initialize the contexts.
+    :param hash: Hash function underlying the contexts.
+
+    Digests obtained from the contexts match those computed by the built-in
+    :obj:`hmac` module (including for keys longer than the hash function's
+    block size, which are hashed down before padding).
+
+    >>> (inner, outer) = _hmac_contexts(bytes(range(200)), hashlib.sha256)
+    >>> h = inner.copy()
+    >>> h.update(bytes([123]))
+    >>> o = outer.copy()
+    >>> o.update(h.digest())
+    >>> o.digest() == hmac.new(bytes(range(200)), bytes([123]), hashlib.sha256).digest()
+    True
+    """
+    block_size = _hash_meta(hash)[1]
+    if len(key) > block_size:
+        instance = hash()
+        instance.update(key)
+        key = instance.digest()
+
+    key = bytes(key) + bytes(block_size - len(key))
+    inner = hash()
+    inner.update(key.translate(_IPAD_TRANSLATION))
+    outer = hash()
+    outer.update(key.translate(_OPAD_TRANSLATION))
+    return (inner, outer)
+
 def _hkdf_extract(
         input_key_material: Union[bytes, bytearray],
         salt: Optional[Union[bytes, bytearray]] = None,
         hash: Callable[ # pylint: disable=redefined-builtin
             [Union[bytes, bytearray]],
             hashlib._hashlib.HASH
-        ] = hashlib.sha256
+        ] = hashlib.sha256,
+        digest_size: Optional[int] = None
     ) -> bytes:
     """
     Extract a pseudorandom key (PRK) using HMAC with the given input key
@@ -25,12 +118,24 @@ def _hkdf_extract(
     :param input_key_material: Initial key material.
     :param salt: Additional salt to incorporate during extraction.
     :param hash: Hash function to use when performing the extraction.
+    :param digest_size: Digest size of the hash function (determined from
+        the hash function itself if not supplied by the caller).
+
+    >>> _hkdf_extract(bytes([123])) == hmac.digest(bytes(32), bytes([123]), 'sha256')
+    True
     """
-    return hmac.new(
-        salt or bytes([0] * hash().digest_size),
-        input_key_material,
-        hash
-    ).digest()
+    if digest_size is None:
+        digest_size = _hash_meta(hash)[0]
+
+    salt = salt or _zero_salt(digest_size)
+    name = _hash_meta(hash)[2]
+
+    # Named hash functions can use the optimized one-shot implementation
+    # supplied by the built-in :obj:`hmac` module.
+    if name is not None:
+        return hmac.digest(salt, input_key_material, name)
+
+    return hmac.new(salt, input_key_material, hash).digest()
 
 def _hkdf_expand(
         length: int,
@@ -39,7 +144,8 @@ def _hkdf_expand(
         hash: Callable[ # pylint: disable=redefined-builtin
             [Union[bytes, bytearray]],
             hashlib._hashlib.HASH
-        ] = hashlib.sha256
+        ] = hashlib.sha256,
+        digest_size: Optional[int] = None
     ) -> bytes:
     """
     Expand the supplied pseudorandom key into output key material of the
@@ -49,28 +155,145 @@ def _hkdf_expand(
     :param pseudorandom_key: Pseudorandom key to expand.
     :param info: Additional binary data to incorporate during expansion.
     :param hash: Hash function to use when performing the extraction.
+    :param digest_size: Digest size of the hash function (determined from
+        the hash function itself if not supplied by the caller).
+
+    A zero-length expansion returns immediately without inspecting the hash
+    function.
+
+    >>> _hkdf_expand(0, bytes(32))
+    b''
+    >>> len(_hkdf_expand(48, bytes(32)))
+    48
     """
-    length_maximum = 255 * hash().digest_size
-    if length > length_maximum:
-        raise ValueError(
-            'maximum length supported by supplied hash function is ' +
-            str(length_maximum)
-        )
+    if length == 0:
+        return bytes()
+
+    if digest_size is None:
+        digest_size = _hash_meta(hash)[0]
+
+    output_key_material = bytearray(length)
+    _hkdf_expand_into(
+        output_key_material,
+        0,
+        length,
+        pseudorandom_key,
+        info,
+        hash,
+        digest_size
+    )
+    return bytes(output_key_material)
+
+def _hkdf_expand_into(
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # pylint: disable=too-many-locals
+        out: bytearray,
+        offset: int,
+        length: int,
+        pseudorandom_key: Union[bytes, bytearray],
+        info: Optional[Union[bytes, bytearray]] = None,
+        hash: Callable[ # pylint: disable=redefined-builtin
+            [Union[bytes, bytearray]],
+            hashlib._hashlib.HASH
+        ] = hashlib.sha256,
+        digest_size: Optional[int] = None
+    ) -> None:
+    """
+    Expand the supplied pseudorandom key into output key material of the
+    specified length, writing it into the supplied buffer beginning at the
+    given offset. Exactly ``length`` bytes are written; a final partial
+    block is truncated rather than written past ``offset + length``.
+
+    :param out: Buffer into which to write the output key material.
+    :param offset: Position in the buffer at which writing begins.
+    :param length: Target length of output key.
+    :param pseudorandom_key: Pseudorandom key to expand.
+    :param info: Additional binary data to incorporate during expansion.
+    :param hash: Hash function to use when performing the extraction.
+    :param digest_size: Digest size of the hash function (determined from
+        the hash function itself if not supplied by the caller).
+
+    >>> buffer = bytearray(4)
+    >>> _hkdf_expand_into(buffer, 0, 4, bytes(32))
+    >>> bytes(buffer) == _hkdf_expand(4, bytes(32))
+    True
+    >>> _hkdf_expand_into(buffer, 0, 0, bytes(32))
+    >>> bytes(buffer) == _hkdf_expand(4, bytes(32))
+    True
+    """
+    if length == 0:
+        return
+
+    if digest_size is None:
+        digest_size = _hash_meta(hash)[0]
 
     info = info or bytes()
     digest = bytes()
-    output_key_material = bytes()
-    i = 0
-    while len(output_key_material) < length:
-        i += 1
-        digest = hmac.new(
-            pseudorandom_key,
-            digest + info + bytes([i]),
-            hash
-        ).digest()
-        output_key_material += digest
-
-    return output_key_material[:length]
+    blocks = (length + digest_size - 1) // digest_size
+    (inner, outer) = _hmac_contexts(pseudorandom_key, hash)
+
+    # Bind loop-invariant attribute lookups to local variables so that each
+    # iteration avoids repeating them.
+    inner_copy = inner.copy
+    outer_copy = outer.copy
+    counter_bytes = _COUNTER_BYTES
+    end = offset + length
+    position = offset
+    for i in range(1, blocks + 1):
+        h = inner_copy()
+        h.update(digest)
+        if info:
+            h.update(info)
+        h.update(counter_bytes[i])
+        o = outer_copy()
+        o.update(h.digest())
+        digest = o.digest()
+        if digest_size <= end - position:
+            out[position : position + digest_size] = digest
+        else:
+            out[position : end] = digest[: end - position]
+        position += digest_size
+
+def _check_arguments(
+        length: int,
+        key: Union[bytes, bytearray],
+        salt: Optional[Union[bytes, bytearray]],
+        info: Optional[Union[bytes, bytearray]]
+    ) -> None:
+    """
+    Verify that the supplied argument values have the expected types and
+    are within the expected ranges, raising an exception if they are not.
+
+    :param length: Target length of output key.
+    :param key: Pseudorandom key to expand.
+    :param salt: Additional salt to incorporate during extraction.
+    :param info: Additional binary data to incorporate during expansion.
+    """
+    # Exact-type membership tests are checked first so that arguments of the
+    # expected built-in types (the overwhelmingly common case) avoid the
+    # slower ``isinstance`` calls.
+    if not (length.__class__ is int or isinstance(length, int)):
+        raise TypeError('length must be an integer')
+
+    if not (key.__class__ in _BYTES_LIKE or isinstance(key, _BYTES_LIKE)):
+        raise TypeError('key must be a bytes-like object')
+
+    if not (
+        salt is None or
+        salt.__class__ in _BYTES_LIKE or
+        isinstance(salt, _BYTES_LIKE)
+    ):
+        raise TypeError('salt must be a bytes-like object')
+
+    if not (
+        info is None or
+        info.__class__ in _BYTES_LIKE or
+        isinstance(info, _BYTES_LIKE)
+    ):
+        raise TypeError('info must be a bytes-like object')
+
+    if length < 0:
+        raise ValueError('length must be a nonnegative integer')
 
 def hkdfs(
         length: int,
@@ -102,6 +325,12 @@ def hkdfs(
     ... ).hex()[:73]
     '1277a50c8cd05020dc073bd129cd84214270a0468e936c496fafee48c10a613a1a3b10fd2'
 
+    A zero-length request is valid and returns an empty byte string (without
+    performing any hashing).
+
+    >>> hkdfs(0, bytes([123]))
+    b''
+
     Note that the maximum supported target length is determined by the length
     of the output of the supplied hash function.
 
@@ -302,22 +531,270 @@ def hkdfs(
 
     Consult the documentation for :obj:`hashlib.new` for more information.
     """
-    if not isinstance(length, int):
-        raise TypeError('length must be an integer')
+    _check_arguments(length, key, salt, info)
 
-    if not isinstance(key, (bytes, bytearray)):
-        raise TypeError('key must be a bytes-like object')
+    if length == 0:
+        return bytes()
 
-    if salt is not None and not isinstance(salt, (bytes, bytearray)):
-        raise TypeError('salt must be a bytes-like object')
+    digest_size = _hash_meta(hash)[0]
+    length_maximum = 255 * digest_size
+    if length > length_maximum:
+        raise ValueError(
+            'maximum length supported by supplied hash function is ' +
+            str(length_maximum)
+        )
 
-    if info is not None and not isinstance(info, (bytes, bytearray)):
-        raise TypeError('info must be a bytes-like object')
+    # Derivations that use a supported built-in hash function can be
+    # delegated to the optional cryptography package (when it is installed),
+    # which wraps an implementation compiled from C.
+    if ( # pragma: no cover
+        _HKDF is not None and
+        hash in _ACCELERATED_HASHES
+    ):
+        return _HKDF(
+            algorithm=_ACCELERATED_HASHES[hash](),
+            length=length,
+            salt=bytes(salt) if salt is not None else None,
+            info=bytes(info) if info is not None else None
+        ).derive(bytes(key))
 
-    if length < 0:
-        raise ValueError('length must be a nonnegative integer')
+    return _hkdf_expand(
+        length,
+        _hkdf_extract(key, salt, hash, digest_size),
+        info,
+        hash,
+        digest_size
+    )
+
+def hkdfs_into(
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        out: bytearray,
+        offset: int,
+        length: int,
+        key: Union[bytes, bytearray],
+        salt: Optional[Union[bytes, bytearray]] = None,
+        info: Optional[Union[bytes, bytearray]] = None,
+        hash: Callable[ # pylint: disable=redefined-builtin
+            [Union[bytes, bytearray]],
+            hashlib._hashlib.HASH
+        ] = hashlib.sha256
+    ) -> None:
+    """
+    Derive output key material in the same manner as :obj:`hkdfs`, but write
+    it into the supplied buffer beginning at the given offset (instead of
+    returning it as a new byte string). This makes it possible to derive
+    many keys into one contiguous region of memory without a per-derivation
+    allocation and copy.
+
+    :param out: Buffer into which to write the output key material.
+    :param offset: Position in the buffer at which writing begins.
+    :param length: Target length of output key.
+    :param key: Pseudorandom key to expand.
+    :param salt: Additional salt to incorporate during extraction.
+    :param info: Additional binary data to incorporate during expansion.
+
+    >>> buffer = bytearray(10)
+    >>> hkdfs_into(buffer, 1, 8, bytes([123]), hash=hashlib.sha512)
+    >>> bytes(buffer[1:9]) == hkdfs(8, bytes([123]), hash=hashlib.sha512)
+    True
+    >>> (buffer[0], buffer[9])
+    (0, 0)
+    >>> buffer = bytearray(64)
+    >>> hkdfs_into(buffer, 0, 64, bytes([123]))
+    >>> bytes(buffer) == hkdfs(64, bytes([123]))
+    True
+    >>> hkdfs_into(bytearray(0), 0, 0, bytes([123]))
+
+    This function performs the same checking of the ``length``, ``key``,
+    ``salt``, ``info``, and ``hash`` arguments as :obj:`hkdfs`, as well as
+    type and range checking of the ``out`` and ``offset`` arguments.
+
+    >>> hkdfs_into(bytes(10), 0, 8, bytes([123]))
+    Traceback (most recent call last):
+      ...
+    TypeError: out must be a bytearray
+    >>> hkdfs_into(bytearray(10), 'abc', 8, bytes([123]))
+    Traceback (most recent call last):
+      ...
+    TypeError: offset must be an integer
+    >>> hkdfs_into(bytearray(10), -1, 8, bytes([123]))
+    Traceback (most recent call last):
+      ...
+    ValueError: offset must be a nonnegative integer
+    >>> hkdfs_into(bytearray(10), 4, 8, bytes([123]))
+    Traceback (most recent call last):
+      ...
+    ValueError: output buffer is too small for the requested length
+    >>> hkdfs_into(bytearray(255 * 32 + 1), 0, 255 * 32 + 1, bytes([123]))
+    Traceback (most recent call last):
+      ...
+    ValueError: maximum length supported by supplied hash function is 8160
+    """
+    if not (out.__class__ is bytearray or isinstance(out, bytearray)):
+        raise TypeError('out must be a bytearray')
+
+    if not (offset.__class__ is int or isinstance(offset, int)):
+        raise TypeError('offset must be an integer')
+
+    _check_arguments(length, key, salt, info)
+
+    if offset < 0:
+        raise ValueError('offset must be a nonnegative integer')
+
+    if len(out) - offset < length:
+        raise ValueError('output buffer is too small for the requested length')
 
-    return _hkdf_expand(length, _hkdf_extract(key, salt, hash), info, hash)
+    if length == 0:
+        return
+
+    digest_size = _hash_meta(hash)[0]
+    length_maximum = 255 * digest_size
+    if length > length_maximum:
+        raise ValueError(
+            'maximum length supported by supplied hash function is ' +
+            str(length_maximum)
+        )
+
+    # Derivations that use a supported built-in hash function can be
+    # delegated to the optional cryptography package (when it is installed),
+    # which wraps an implementation compiled from C.
+    if ( # pragma: no cover
+        _HKDF is not None and
+        hash in _ACCELERATED_HASHES
+    ):
+        out[offset : offset + length] = _HKDF(
+            algorithm=_ACCELERATED_HASHES[hash](),
+            length=length,
+            salt=bytes(salt) if salt is not None else None,
+            info=bytes(info) if info is not None else None
+        ).derive(bytes(key))
+        return
+
+    _hkdf_expand_into(
+        out,
+        offset,
+        length,
+        _hkdf_extract(key, salt, hash, digest_size),
+        info,
+        hash,
+        digest_size
+    )
+
+class Deriver: # pylint: disable=too-few-public-methods
+    """
+    Object that performs the extraction step for a fixed key, salt, and
+    hash function once at construction, enabling repeated derivations that
+    vary only the target length and the additional binary data to skip
+    that step (and its HMAC invocation) entirely.
+
+    :param key: Pseudorandom key to expand.
+    :param salt: Additional salt to incorporate during extraction.
+    :param hash: Hash function to use when performing the derivations.
+
+    >>> deriver = Deriver(bytes([123]), hash=hashlib.sha512)
+    >>> deriver.derive(1024) == hkdfs(1024, bytes([123]), hash=hashlib.sha512)
+    True
+    >>> deriver.derive(32, bytes([3])) == hkdfs(
+    ...     32, bytes([123]), info=bytes([3]), hash=hashlib.sha512
+    ... )
+    True
+    >>> deriver.derive(0)
+    b''
+
+    The constructor performs the same checking of the ``key`` and ``salt``
+    arguments as :obj:`hkdfs`; the :obj:`Deriver.derive` method does the
+    same for the ``length`` and ``info`` arguments.
+
+    >>> Deriver('abc')
+    Traceback (most recent call last):
+      ...
+    TypeError: key must be a bytes-like object
+    >>> Deriver(bytes([123]), 'abc')
+    Traceback (most recent call last):
+      ...
+    TypeError: salt must be a bytes-like object
+    >>> deriver.derive('abc')
+    Traceback (most recent call last):
+      ...
+    TypeError: length must be an integer
+    >>> deriver.derive(32, 'abc')
+    Traceback (most recent call last):
+      ...
+    TypeError: info must be a bytes-like object
+    >>> deriver.derive(255 * 64 + 1)
+    Traceback (most recent call last):
+      ...
+    ValueError: maximum length supported by supplied hash function is 16320
+    """
+    def __init__(
+            self: Deriver,
+            key: Union[bytes, bytearray],
+            salt: Optional[Union[bytes, bytearray]] = None,
+            hash: Callable[ # pylint: disable=redefined-builtin
+                [Union[bytes, bytearray]],
+                hashlib._hashlib.HASH
+            ] = hashlib.sha256
+        ):
+        """
+        Validate the supplied arguments and extract the pseudorandom key
+        to be expanded by invocations of :obj:`Deriver.derive`.
+        """
+        _check_arguments(0, key, salt, None)
+        self._hash = hash
+        self._digest_size = _hash_meta(hash)[0]
+        self._pseudorandom_key = _hkdf_extract(
+            key,
+            salt,
+            hash,
+            self._digest_size
+        )
+
+    def derive(
+            self: Deriver,
+            length: int,
+            info: Optional[Union[bytes, bytearray]] = None
+        ) -> bytes:
+        """
+        Expand the extracted pseudorandom key into output key material
+        having ``length`` bytes (optionally incorporating ``info``).
+
+        :param length: Target length of output key.
+        :param info: Additional binary data to incorporate during expansion.
+        """
+        # The second argument below is known to be valid; only the supplied
+        # ``length`` and ``info`` argument values require checking.
+        _check_arguments(length, self._pseudorandom_key, None, info)
+
+        if length == 0:
+            return bytes()
+
+        length_maximum = 255 * self._digest_size
+        if length > length_maximum:
+            raise ValueError(
+                'maximum length supported by supplied hash function is ' +
+                str(length_maximum)
+            )
+
+        # Expansions that use a supported built-in hash function can be
+        # delegated to the optional cryptography package (when it is
+        # installed), which wraps an implementation compiled from C.
+        if ( # pragma: no cover
+            _HKDFExpand is not None and
+            self._hash in _ACCELERATED_HASHES
+        ):
+            return _HKDFExpand(
+                algorithm=_ACCELERATED_HASHES[self._hash](),
+                length=length,
+                info=bytes(info) if info is not None else None
+            ).derive(self._pseudorandom_key)
+
+        return _hkdf_expand(
+            length,
+            self._pseudorandom_key,
+            info,
+            self._hash,
+            self._digest_size
+        )
 
 if __name__ == '__main__':
     doctest.testmod() # pragma: no cover